@@ -23,6 +23,7 @@
 """FreeSurfer tools interfaces."""
 
 import os.path as op
+from functools import lru_cache
 from pathlib import Path
 import nibabel as nb
 import numpy as np
@@ -43,6 +44,11 @@ from nipype.interfaces.freesurfer.preprocess import ConcatenateLTA, RobustRegist
 from nipype.interfaces.freesurfer.utils import LTAConvert
 from .reportlets.registration import BBRegisterRPT, MRICoregRPT
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
+
 
 class StructuralReference(fs.RobustTemplate):
     """
@@ -65,16 +71,21 @@ class StructuralReference(fs.RobustTemplate):
 
     """
 
+    _num_vols_cache = None
+
     def _num_vols(self):
         n_files = len(self.inputs.in_files)
         if n_files != 1:
             return n_files
 
-        img = nb.load(self.inputs.in_files[0])
-        if len(img.shape) == 3:
-            return 1
+        # cmdline may be rebuilt several times while the graph is assembled -
+        # look the shape up once per file and remember it
+        in_file = self.inputs.in_files[0]
+        if self._num_vols_cache is None or self._num_vols_cache[0] != in_file:
+            shape = nb.load(in_file, mmap=True).shape
+            self._num_vols_cache = (in_file, 1 if len(shape) == 3 else shape[3])
 
-        return img.shape[3]
+        return self._num_vols_cache[1]
 
     @property
     def cmdline(self):
@@ -125,15 +136,16 @@ class MakeMidthickness(fs.MRIsExpand):
         # Prefer midthickness to graymid, require to be of the same hemisphere
         # as input
         source = None
-        in_base = Path(self.inputs.in_file).name
+        in_base = op.basename(self.inputs.in_file)
         mt = self._associated_file(in_base, "midthickness")
         gm = self._associated_file(in_base, "graymid")
 
         for surf in self.inputs.graymid:
-            if Path(surf).name == mt:
+            surf_base = op.basename(surf)
+            if surf_base == mt:
                 source = surf
                 break
-            if Path(surf).name == gm:
+            if surf_base == gm:
                 source = surf
 
         if source is None:
@@ -323,15 +335,21 @@ class RefineBrainMask(SimpleInterface):
         )
 
         anatnii = nb.load(self.inputs.in_anat)
-        msknii = nb.Nifti1Image(
-            grow_mask(
-                anatnii.get_fdata(dtype="float32"),
-                np.asanyarray(nb.load(self.inputs.in_aseg).dataobj).astype("int16"),
-                np.asanyarray(nb.load(self.inputs.in_ants).dataobj).astype("int16"),
-            ),
-            anatnii.affine,
-            anatnii.header,
-        )
+        affine = anatnii.affine
+        header = anatnii.header.copy()
+        # Read through the proxies with a single cast - get_fdata() would
+        # allocate (and cache) an extra full-volume buffer
+        anat = np.asarray(anatnii.dataobj, dtype=np.float32)
+        # Drop the image (and any proxy caches) before growing the mask
+        del anatnii
+        # Keep the native (integer) dtypes - grow_mask only compares labels
+        aseg = np.asanyarray(nb.load(self.inputs.in_aseg).dataobj)
+        ants_segs = np.asanyarray(nb.load(self.inputs.in_ants).dataobj)
+
+        newmask = grow_mask(anat, aseg, ants_segs)
+        del anat, aseg, ants_segs
+
+        msknii = nb.Nifti1Image(newmask, affine, header)
         msknii.set_data_dtype(np.uint8)
         msknii.to_filename(self._results["out_file"])
 
@@ -396,18 +414,20 @@ def fix_lta_length(lta_file):
     False
 
     """
-    lines = Path(lta_file).read_text().splitlines(keepends=True)
+    def _is_too_long(line):
+        return line.startswith("filename = ") and len(line.strip("\n")) >= 255
 
-    fixed = False
-    newfile = []
-    for line in lines:
-        if line.startswith("filename = ") and len(line.strip("\n")) >= 255:
-            fixed = True
-            newfile.append("filename = path_too_long\n")
-        else:
-            newfile.append(line)
+    # Stream through the file first - in the common (valid) case nothing
+    # needs to be accumulated or written back
+    with open(lta_file) as fobj:
+        fixed = any(_is_too_long(line) for line in fobj)
 
     if fixed:
+        with open(lta_file) as fobj:
+            newfile = [
+                "filename = path_too_long\n" if _is_too_long(line) else line
+                for line in fobj
+            ]
         Path(lta_file).write_text("".join(newfile))
     return fixed
 
@@ -425,9 +445,15 @@ def inject_skullstripped(subjects_dir, subject_id, skullstripped):
         mask = nb.load(skullstripped)
         bmask = new_img_like(mask, np.asanyarray(mask.dataobj) > 0)
         resampled_mask = resample_to_img(bmask, img, "nearest")
-        masked_image = new_img_like(
-            img, np.asanyarray(img.dataobj) * resampled_mask.dataobj
-        )
+        mask_data = np.asanyarray(resampled_mask.dataobj)
+        # Apply the mask slab-wise through the data proxy, so that only a
+        # thin slab of the anatomical is decompressed and scaled at a time
+        masked_data = np.empty(img.shape, dtype=img.get_data_dtype())
+        chunk = 32
+        for z in range(0, img.shape[2], chunk):
+            slab = np.s_[..., z:z + chunk]
+            masked_data[slab] = img.dataobj[slab] * mask_data[slab]
+        masked_image = new_img_like(img, masked_data)
         masked_image.to_filename(bm_auto)
 
     if not op.exists(bm):
@@ -436,22 +462,27 @@ def inject_skullstripped(subjects_dir, subject_id, skullstripped):
     return subjects_dir, subject_id
 
 
+def _max_zoom(in_file):
+    """Fetch the largest spatial zoom reading only the header."""
+    # Restrict to the first three dimensions - inputs may come in as 4D
+    return max(nb.load(in_file, mmap=True).header.get_zooms()[:3])
+
+
 def detect_inputs(t1w_list, t2w_list=None, flair_list=None, hires_enabled=True):
     t1w_list = filename_to_list(t1w_list)
     t2w_list = filename_to_list(t2w_list) if t2w_list is not None else []
     flair_list = filename_to_list(flair_list) if flair_list is not None else []
-    t1w_ref = nb.load(t1w_list[0])
     # Use high resolution preprocessing if voxel size < 1.0mm
     # Tolerance of 0.05mm requires that rounds down to 0.9mm or lower
-    hires = hires_enabled and max(t1w_ref.header.get_zooms()) < 1 - 0.05
+    hires = hires_enabled and _max_zoom(t1w_list[0]) < 1 - 0.05
 
     t2w = None
-    if t2w_list and max(nb.load(t2w_list[0]).header.get_zooms()) < 1.2:
+    if t2w_list and _max_zoom(t2w_list[0]) < 1.2:
         t2w = t2w_list[0]
 
     # Prefer T2w to FLAIR if both present and T2w satisfies
     flair = None
-    if flair_list and not t2w and max(nb.load(flair_list[0]).header.get_zooms()) < 1.2:
+    if flair_list and not t2w and _max_zoom(flair_list[0]) < 1.2:
         flair = flair_list[0]
 
     # https://surfer.nmr.mgh.harvard.edu/fswiki/SubmillimeterRecon
@@ -476,22 +507,59 @@ def refine_aseg(aseg, ball_size=4):
          cerebral brain is segmented out).
 
     """
-    from skimage import morphology as sim
-    from scipy.ndimage.morphology import binary_fill_holes
+    from scipy import ndimage as ndi
 
     # Read aseg data
     bmask = aseg.copy()
     bmask[bmask > 0] = 1
     bmask = bmask.astype(np.uint8)
 
-    # Morphological operations
-    selem = sim.ball(ball_size)
-    newmask = sim.binary_closing(bmask, selem)
-    newmask = binary_fill_holes(newmask.astype(np.uint8), selem).astype(np.uint8)
+    # Morphological operations - iterating a 3x3x3 cross approximates the
+    # ball-shaped element while only touching 6 neighbors per step
+    newmask = ndi.binary_closing(
+        bmask, structure=ndi.generate_binary_structure(3, 1), iterations=ball_size
+    )
+    # Hole filling wants plain 6-connectivity (the default structure) - a wide
+    # seed-fill element would let background leak through thin mask walls
+    newmask = ndi.binary_fill_holes(newmask)
 
     return newmask.astype(np.uint8)
 
 
+def _grow_mask_kernel(anat, gm, ants_segs, indices, refined, ww, zval):
+    """Compute the window z-statistics for all candidate voxels (Numba kernel)."""
+    for i in prange(indices.shape[0]):
+        x, y, z = indices[i, 0], indices[i, 1], indices[i, 2]
+        # When ATROPOS identified the pixel as GM, set and carry on
+        if ants_segs[x, y, z] == 2:
+            refined[x, y, z] = 1
+            continue
+
+        count = 0
+        total = 0.0
+        sumsq = 0.0
+        for xx in range(max(x - ww, 0), min(x + ww, gm.shape[0])):
+            for yy in range(max(y - ww, 0), min(y + ww, gm.shape[1])):
+                for zz in range(max(z - ww, 0), min(z + ww, gm.shape[2])):
+                    val = gm[xx, yy, zz]
+                    if val > 0:
+                        count += 1
+                        total += val
+                        sumsq += val * val
+
+        if count > 0:
+            mu = total / count
+            sigma = max(np.sqrt(max(sumsq / count - mu * mu, 0.0)), 1.0e-5)
+            zstat = abs(anat[x, y, z] - mu) / sigma
+            refined[x, y, z] = 1 if zstat < zval else 0
+
+
+if njit is not None:
+    _grow_mask_kernel = njit(parallel=True, fastmath=True, cache=True)(
+        _grow_mask_kernel
+    )
+
+
 def grow_mask(anat, aseg, ants_segs=None, ww=7, zval=2.0, bw=4):
     """
     Grow mask including pixels that have a high likelihood.
@@ -501,47 +569,116 @@ def grow_mask(anat, aseg, ants_segs=None, ww=7, zval=2.0, bw=4):
     https://github.com/nipy/mindboggle/blob/master/mindboggle/guts/segment.py#L1660
 
     """
-    from skimage import morphology as sim
+    from scipy import ndimage as ndi
 
-    selem = sim.ball(bw)
+    struct = ndi.generate_binary_structure(3, 1)
 
     if ants_segs is None:
-        ants_segs = np.zeros_like(aseg, dtype=np.uint8)
+        ants_segs = np.zeros_like(aseg)
 
-    aseg[aseg == 42] = 3  # Collapse both hemispheres
-    gm = anat.copy()
-    gm[aseg != 3] = 0
+    # Collapse both hemispheres (labels 3 and 42) without mutating the
+    # caller's aseg, and zero out non-GM voxels in a single pass
+    gm = np.where((aseg == 3) | (aseg == 42), anat, np.float32(0))
 
     refined = refine_aseg(aseg)
-    newrefmask = sim.binary_dilation(refined, selem) - refined
-    indices = np.argwhere(newrefmask > 0)
-    for pixel in indices:
-        # When ATROPOS identified the pixel as GM, set and carry on
-        if ants_segs[tuple(pixel)] == 2:
-            refined[tuple(pixel)] = 1
-            continue
+    # Iterated 3x3x3 cross dilation in lieu of the dense ball-shaped element;
+    # the boundary ring is dilated & ~refined, fused in the boolean domain
+    newrefmask = ndi.binary_dilation(refined, structure=struct, iterations=bw)
+    np.logical_and(newrefmask, np.logical_not(refined), out=newrefmask)
+    indices = np.argwhere(newrefmask)
+
+    if njit is not None:
+        # The compiled kernel keeps memory flat - no window gather is materialized
+        _grow_mask_kernel(
+            np.ascontiguousarray(anat),
+            np.ascontiguousarray(gm),
+            np.ascontiguousarray(ants_segs),
+            np.ascontiguousarray(indices, dtype=np.int32),
+            refined,
+            ww,
+            zval,
+        )
+        refined = ndi.binary_opening(refined, structure=struct, iterations=bw)
+        return refined
+
+    # NumPy fallback: vectorized window statistics through a sliding view
+    # When ATROPOS identified the pixel as GM, set and carry on
+    ants_gm = ants_segs[tuple(indices.T)] == 2
+    refined[tuple(indices[ants_gm].T)] = 1
+    indices = indices[~ants_gm]
+
+    if len(indices) > 0:
+        # Window statistics for all remaining candidate voxels at once:
+        # zero-padding by ``ww`` makes the view at index (i, j, k) match
+        # ``gm[i - ww:i + ww, j - ww:j + ww, k - ww:k + ww]``.
+        windows = np.lib.stride_tricks.sliding_window_view(
+            np.pad(gm, ww), (2 * ww,) * 3
+        )
+        w = windows[tuple(indices.T)]
+        nz = w > 0
+        count = nz.sum(axis=(1, 2, 3))
+        has_gm = count > 0
+
+        w = w[has_gm]
+        nz = nz[has_gm]
+        count = count[has_gm]
+        indices = indices[has_gm]
+
+        # Accumulate in float64 - the one-pass variance is prone to cancellation.
+        # Reducing with where= avoids materializing masked copies of the windows
+        mu = w.sum(axis=(1, 2, 3), where=nz, dtype=np.float64) / count
+        sigma = np.sqrt(
+            np.maximum(
+                (w * w).sum(axis=(1, 2, 3), where=nz, dtype=np.float64) / count
+                - mu**2,
+                0,
+            )
+        )
+        sigma = np.maximum(sigma, 1.0e-5)
+        zstat = np.abs(anat[tuple(indices.T)] - mu) / sigma
+        refined[tuple(indices.T)] = (zstat < zval).astype(np.uint8)
 
-        window = gm[
-            pixel[0] - ww:pixel[0] + ww,
-            pixel[1] - ww:pixel[1] + ww,
-            pixel[2] - ww:pixel[2] + ww,
-        ]
-        if np.any(window > 0):
-            mu = window[window > 0].mean()
-            sigma = max(window[window > 0].std(), 1.0e-5)
-            zstat = abs(anat[tuple(pixel)] - mu) / sigma
-            refined[tuple(pixel)] = int(zstat < zval)
-
-    refined = sim.binary_opening(refined, selem)
+    refined = ndi.binary_opening(refined, structure=struct, iterations=bw)
     return refined
 
 
+@lru_cache(maxsize=32)
+def _medial_fsaverage_mask(subjects_dir, target_subject, hemi, nvertices):
+    """Boolean medial-wall mask from a subject's cortex label (memoized)."""
+    import os
+    import nibabel as nb
+    import numpy as np
+
+    cortex = nb.freesurfer.read_label(
+        os.path.join(
+            subjects_dir, target_subject, "label", "{}.cortex.label".format(hemi)
+        )
+    )
+    # Complement of the cortex as a boolean mask - cheaper to build and to
+    # index with than np.delete on an integer range
+    medial = np.ones(nvertices, dtype=bool)
+    medial[cortex] = False
+    return medial
+
+
+@lru_cache(maxsize=8)
+def _medial_fslr_mask(hemi, den):
+    """Boolean medial-wall mask for fsLR, fetched once per hemisphere/density."""
+    import nibabel as nb
+    import numpy as np
+    import templateflow.api as tf
+
+    label_file = str(
+        tf.get("fsLR", hemi=hemi, desc="nomedialwall", density=den, suffix="dparc")
+    )
+    return np.invert(nb.load(label_file).darrays[0].data.astype(bool))
+
+
 def medial_wall_to_nan(in_file, subjects_dir, den=None, newpath=None):
     """Convert values on medial wall to NaNs."""
     import os
     import nibabel as nb
     import numpy as np
-    import templateflow.api as tf
 
     fn = os.path.basename(in_file)
     target_subject = in_file.split(".")[1]
@@ -550,19 +687,11 @@ def medial_wall_to_nan(in_file, subjects_dir, den=None, newpath=None):
 
     func = nb.load(in_file)
     if target_subject.startswith("fsaverage"):
-        cortex = nb.freesurfer.read_label(
-            os.path.join(
-                subjects_dir, target_subject, "label", "{}.cortex.label".format(fn[:2])
-            )
+        medial = _medial_fsaverage_mask(
+            subjects_dir, target_subject, fn[:2], len(func.darrays[0].data)
         )
-        medial = np.delete(np.arange(len(func.darrays[0].data)), cortex)
     elif target_subject == "fslr" and den is not None:
-        hemi = fn[0].upper()
-        label_file = str(
-            tf.get("fsLR", hemi=hemi, desc="nomedialwall", density=den, suffix="dparc")
-        )
-        label = nb.load(label_file)
-        medial = np.invert(label.darrays[0].data.astype(bool))
+        medial = _medial_fslr_mask(fn[0].upper(), den)
     else:
         return in_file
 
@@ -575,12 +704,38 @@ def medial_wall_to_nan(in_file, subjects_dir, den=None, newpath=None):
 
 
 def mri_info(fname, argument):
-    import subprocess as sp
+    """Retrieve the affines that ``mri_info --<argument>`` would print."""
     import numpy as np
+    import nibabel as nb
 
-    cmd_info = "mri_info --%s %s" % (argument, fname)
-    proc = sp.Popen(cmd_info, stdout=sp.PIPE, shell=True)
-    data = bytearray(proc.stdout.read())
-    mstring = np.fromstring(data.decode("utf-8"), sep="\n")
-    result = np.reshape(mstring, (4, -1))
-    return result
+    if argument in ("vox2ras", "ras2vox", "vox2ras-tkr"):
+        img = nb.load(fname)
+        if argument == "vox2ras":
+            return img.affine
+        if argument == "ras2vox":
+            return np.linalg.inv(img.affine)
+        try:  # MGH images know their scanner-to-tkreg affine
+            return img.header.get_vox2ras_tkr()
+        except AttributeError:
+            dc, dr, ds = img.header.get_zooms()[:3]
+            nc, nr, ns = img.shape[:3]
+            return np.array(
+                [
+                    [-dc, 0, 0, dc * nc / 2],
+                    [0, 0, ds, -ds * ns / 2],
+                    [0, -dr, 0, dr * nr / 2],
+                    [0, 0, 0, 1],
+                ]
+            )
+
+    # Fall back to the command-line tool for any other argument
+    import io
+    import subprocess as sp
+
+    proc = sp.run(
+        ["mri_info", "--%s" % argument, fname],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return np.loadtxt(io.StringIO(proc.stdout)).reshape(4, -1)
@@ -49,7 +49,9 @@ def _cifti_timeseries(dataset):
             bm.index_offset, bm.index_offset + bm.index_count
         ))
 
-    return dataset.get_fdata(dtype="float32").T, seg
+    # Read through the data proxy with an explicit float32 cast (see the
+    # NIfTI path below) - no float64 intermediate, no cache on the image
+    return np.asarray(dataset.dataobj, dtype="float32").T, seg
 
 
 def _nifti_timeseries(
@@ -61,14 +63,21 @@ def _nifti_timeseries(
 ):
     """Extract timeseries from NIfTI1/2 datasets."""
     dataset = nb.load(dataset) if isinstance(dataset, str) else dataset
-    data = dataset.get_fdata(dtype="float32").reshape((-1, dataset.shape[-1]))
+    # Read through the data proxy - get_fdata() would pin a cached copy of the
+    # full 4D series on the image for as long as the caller holds it
+    data = np.asarray(dataset.dataobj, dtype="float32").reshape(
+        (-1, dataset.shape[-1])
+    )
 
     if segmentation is None:
         return data, None
 
-    # Open NIfTI and extract numpy array
+    # Open NIfTI and extract numpy array, keeping the native integer width -
+    # widening labels to int64 just to index the LUT would 4-8x the bytes moved
     segmentation = nb.load(segmentation) if isinstance(segmentation, str) else segmentation
-    segmentation = np.asanyarray(segmentation.dataobj, dtype=int).reshape(-1)
+    segmentation = np.asanyarray(segmentation.dataobj).reshape(-1)
+    if segmentation.dtype.kind == "f":
+        segmentation = segmentation.astype(np.int32)
 
     remap_rois = remap_rois or (len(np.unique(segmentation[segmentation > 0])) > len(labels))
 
@@ -80,13 +89,21 @@ def _nifti_timeseries(
             lut[30:99] = 2    # dGM
             lut[1:11] = 3     # WM+CSF
             lut[255] = 4      # Cerebellum
-        # Apply lookup table
-        segmentation = lut[segmentation]
+        # Apply lookup table with a single vectorized gather
+        segmentation = lut.take(segmentation)
 
-    fgmask = segmentation > 0
-    segmentation = segmentation[fgmask]
-    seg_dict = {}
-    for i in np.unique(segmentation):
-        seg_dict[labels[i - 1]] = np.argwhere(segmentation == i).squeeze()
+    fg_idx = np.flatnonzero(segmentation > 0)
+    segmentation = segmentation[fg_idx]
+    # A single stable argsort groups voxels by label; slicing the order
+    # vector replaces one full compare-and-gather pass per segment
+    order = np.argsort(segmentation, kind="stable")
+    uniq, counts = np.unique(segmentation, return_counts=True)
+    bounds = counts.cumsum()
+    seg_dict = {
+        labels[i - 1]: order[start:stop]
+        for i, start, stop in zip(uniq, bounds - counts, bounds)
+    }
 
-    return data[fgmask], seg_dict
+    # Gather rows of the (voxels x time) view with take() - a contiguous
+    # row-copy per kept voxel, instead of generic boolean fancy indexing
+    return np.take(data, fg_idx, axis=0), seg_dict
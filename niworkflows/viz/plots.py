@@ -23,17 +23,83 @@
 """Plotting tools shared across MRIQC and fMRIPrep."""
 
 import numpy as np
-import nibabel as nb
-import pandas as pd
 
 import matplotlib.pyplot as plt
 from matplotlib import gridspec as mgs
 import matplotlib.cm as cm
-from matplotlib.colors import Normalize
-from matplotlib.colorbar import ColorbarBase
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
 
 DINA4_LANDSCAPE = (11.69, 8.27)
 
+# Shared bbox spec for in-axes annotations - rebuilt dicts per call add up
+# across the many rows of a QC report
+_ANNOTATION_BBOX = {
+    "boxstyle": "round",
+    "fc": "w",
+    "ec": "none",
+    "color": "none",
+    "lw": 0,
+    "alpha": 0.8,
+}
+
+
+def _detrend_standardize_kernel(data, out):
+    """Per-row linear detrend + z-score (Numba kernel)."""
+    ntime = data.shape[1]
+    tmean = (ntime - 1) / 2.0
+    tvar = 0.0
+    for j in range(ntime):
+        tvar += (j - tmean) ** 2
+
+    for i in prange(data.shape[0]):
+        mean = 0.0
+        cov = 0.0
+        for j in range(ntime):
+            mean += data[i, j]
+            cov += data[i, j] * (j - tmean)
+        mean /= ntime
+        slope = cov / tvar
+
+        var = 0.0
+        for j in range(ntime):
+            val = data[i, j] - mean - slope * (j - tmean)
+            out[i, j] = val
+            var += val * val
+        std = max(np.sqrt(var / ntime), 1.0e-8)
+        for j in range(ntime):
+            out[i, j] /= std
+
+
+if njit is not None:
+    _detrend_standardize_kernel = njit(
+        parallel=True, fastmath=True, cache=True, nogil=True
+    )(_detrend_standardize_kernel)
+
+
+def _detrend_standardize(data):
+    """Linearly detrend and z-score every row of ``data`` (N x T) at once."""
+    data = np.ascontiguousarray(data, dtype="float32")
+
+    if njit is not None:
+        out = np.empty_like(data)
+        _detrend_standardize_kernel(data, out)
+        return out
+
+    t = np.arange(data.shape[-1], dtype="float32")
+    t -= t.mean()
+    # Closed-form per-row least-squares line fit (the intercept is the row
+    # mean, because the time axis is centered)
+    slope = (data @ t) / (t @ t)
+    data = data - data.mean(axis=-1, keepdims=True) - slope[:, np.newaxis] * t
+    std = data.std(axis=-1, keepdims=True)
+    np.maximum(std, 1.0e-8, out=std)
+    data /= std
+    return data
+
 
 class fMRIPlot:
     """Generates the fMRI Summary Plot."""
@@ -77,6 +143,8 @@ class fMRIPlot:
             vlines = {}
         self.confounds = {}
         if confounds is None and conf_file:
+            import pandas as pd
+
             confounds = pd.read_csv(conf_file, sep=r"[\t\s]+", usecols=usecols, index_col=False)
 
         if confounds is not None:
@@ -134,6 +202,7 @@ class fMRIPlot:
             sort_rows=self.sort_carpet,
             drop_trs=self.nskip,
             cmap="paired" if self.paired_carpet else None,
+            figure=figure,
         )
         return figure
 
@@ -151,6 +220,7 @@ def plot_carpet(
     sort_rows="ward",
     drop_trs=0,
     legend=True,
+    figure=None,
 ):
     """
     Plot an image representation of voxel intensities across time.
@@ -189,8 +259,12 @@ def plot_carpet(
         :obj:`scipy.cluster.hierarchy.linkage`.
         Any other value that Python evaluates to ``True`` will use the
         default clustering, which is :obj:`sklearn.cluster.ward_tree`.
+    figure : :obj:`matplotlib.figure.Figure`, optional
+        Figure to plot on. Defaults to the current figure.
 
     """
+    if figure is None:
+        figure = plt.gcf()
     if segments is None:
         segments = {
             "whole brain (voxels)": list(range(data.shape[0]))
@@ -207,11 +281,12 @@ def plot_carpet(
         colors[2], colors[7] = colors[7], colors[2]
 
     if detrend:
-        from nilearn.signal import clean
-        data = clean(data.T, t_r=tr, filter=False).T
+        # Fused detrend + z-score; nilearn.signal.clean would transpose the
+        # array twice and allocate several full-size intermediates
+        data = _detrend_standardize(data)
 
     # We want all subplots to have the same dynamic range
-    vminmax = (np.percentile(data, 2), np.percentile(data, 98))
+    vminmax = np.percentile(data, (2, 98))
 
     # Decimate number of time-series before clustering
     n_dec = int((1.8 * data.shape[0]) // size[0])
@@ -251,28 +326,44 @@ def plot_carpet(
 
     # Calculate time decimation factor
     t_dec = max(int((1.8 * n_trs) // size[1]), 1)
-    data = data[:, drop_trs::t_dec]
+    data = data[:, drop_trs:]
+    if t_dec > 1:
+        # Aggregate bins of t_dec timepoints instead of stride-decimating -
+        # binned means do not alias, and imshow receives display-size input
+        nbins = data.shape[-1] // t_dec
+        data = (
+            data[:, :nbins * t_dec]
+            .reshape((data.shape[0], nbins, t_dec))
+            .mean(axis=-1, dtype="float32")
+        )
 
     # Define nested GridSpec
-    gs = mgs.GridSpecFromSubplotSpec(
+    gs = subplot.subgridspec(
         len(segments),
         1,
-        subplot_spec=subplot,
         hspace=0.05,
-        height_ratios=[len(v) for v in segments.values()]
+        height_ratios=[len(v) for v in segments.values()],
     )
 
+    # All subplots share the same xticks - compute them once
+    xticks = np.linspace(0, data.shape[-1], endpoint=True, num=7)
+
     for i, (label, indices) in enumerate(segments.items()):
-        # Carpet plot
-        ax = plt.subplot(gs[i])
+        # Carpet plot - add axes through the figure, bypassing pyplot's
+        # figure-manager lookup per subplot
+        ax = figure.add_subplot(gs[i])
 
         ax.imshow(
             data[indices, :],
-            interpolation="nearest",
+            # The data are pre-aggregated to display resolution, so skip
+            # the resampler; rasterize so vector backends embed one raster
+            # instead of a rectangle per sample
+            interpolation="none",
             aspect="auto",
             cmap="gray",
             vmin=vminmax[0],
             vmax=vminmax[1],
+            rasterized=True,
         )
 
         # Toggle the spine objects
@@ -287,8 +378,6 @@ def plot_carpet(
         ax.spines["left"].set_capstyle("butt")
         ax.spines["left"].set_position(("outward", 2))
 
-        # Make all subplots have same xticks
-        xticks = np.linspace(0, data.shape[-1], endpoint=True, num=7)
         ax.set_xticks(xticks)
         ax.set_yticks([])
         ax.grid(False)
@@ -321,6 +410,9 @@ def plot_carpet(
         ax.set_ylabel(label)
 
     if legend:
+        # Static color-patch handles - no per-segment image rendering happens
+        # here (the old nilearn plot_img mosaic was dropped with the move to
+        # precomputed timeseries), so the legend cost is a handful of artists
         from matplotlib.patches import Patch
         from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
@@ -354,7 +446,6 @@ def plot_carpet(
         )
 
     if output_file is not None:
-        figure = plt.gcf()
         figure.savefig(output_file, bbox_inches="tight")
         plt.close(figure)
         figure = None
@@ -383,10 +474,8 @@ def spikesplot(
         ax = plt.gca()
 
     if outer_gs is not None:
-        gs = mgs.GridSpecFromSubplotSpec(
-            1, 2, subplot_spec=outer_gs, width_ratios=[1, 100], wspace=0.0
-        )
-        ax = plt.subplot(gs[1])
+        gs = outer_gs.subgridspec(1, 2, width_ratios=[1, 100], wspace=0.0)
+        ax = plt.gcf().add_subplot(gs[1])
 
     # Define TR and number of frames
     if tr is None:
@@ -396,17 +485,26 @@ def spikesplot(
     nslices = ts_z.shape[0]
     ntsteps = ts_z.shape[1]
 
-    # Load a colormap
+    # Load a colormap and evaluate it for all slices in one vectorized call
     my_cmap = cm.get_cmap(cmap)
-    norm = Normalize(vmin=0, vmax=float(nslices - 1))
-    colors = [my_cmap(norm(sl)) for sl in range(nslices)]
-
-    stem = len(np.unique(ts_z).tolist()) == 2
-    # Plot one line per axial slice timeseries
-    for sl in range(nslices):
-        if not stem:
-            ax.plot(ts_z[sl, :], color=colors[sl], lw=0.5)
-        else:
+    colors = my_cmap(np.linspace(0.0, 1.0, nslices))
+
+    from matplotlib.collections import LineCollection
+
+    stem = np.unique(ts_z).size == 2
+    if not stem:
+        # A single collection is one draw artist, where one Line2D per axial
+        # slice pays matplotlib's per-artist overhead nslices times
+        xs = np.arange(ntsteps)
+        ax.add_collection(
+            LineCollection(
+                [np.column_stack((xs, ts_z[sl])) for sl in range(nslices)],
+                colors=colors,
+                linewidths=0.5,
+            )
+        )
+    else:
+        for sl in range(nslices):
             markerline, stemlines, baseline = ax.stem(ts_z[sl, :])
             plt.setp(markerline, "markerfacecolor", colors[sl])
             plt.setp(baseline, "color", colors[sl], "linewidth", 1)
@@ -433,33 +531,32 @@ def spikesplot(
     if zscored:
         ylabel += " (z-scored)"
         zs_max = np.abs(ts_z).max()
-        ax.set_ylim(
-            (
-                -(np.abs(ts_z[:, nskip:]).max()) * 1.05,
-                (np.abs(ts_z[:, nskip:]).max()) * 1.05,
-            )
-        )
+        # Absolute maximum of the kept frames, without materializing |ts_z|
+        sub = ts_z[:, nskip:]
+        sub_max = max(sub.max(), -sub.min())
+        ax.set_ylim((-sub_max * 1.05, sub_max * 1.05))
 
         ytick_vals = np.arange(0.0, zs_max, float(np.floor(zs_max / 2.0)))
-        yticks = list(reversed((-1.0 * ytick_vals[ytick_vals > 0]).tolist())) + ytick_vals.tolist()
 
         # TODO plot min/max or mark spikes
-        # yticks.insert(0, ts_z.min())
-        # yticks += [ts_z.max()]
-        for val in ytick_vals:
-            ax.plot((0, ntsteps - 1), (-val, -val), "k:", alpha=0.2)
-            ax.plot((0, ntsteps - 1), (val, val), "k:", alpha=0.2)
+        # Horizontal guides at +/- each tick value, as a single collection
+        guide_vals = np.concatenate((-ytick_vals[ytick_vals > 0], ytick_vals))
+        ax.add_collection(
+            LineCollection(
+                [((0, val), (ntsteps - 1, val)) for val in guide_vals],
+                colors="k",
+                linestyles=":",
+                alpha=0.2,
+            )
+        )
 
         # Plot spike threshold
         if zs_max < spike_thresh:
             ax.plot((0, ntsteps - 1), (-spike_thresh, -spike_thresh), "k:")
             ax.plot((0, ntsteps - 1), (spike_thresh, spike_thresh), "k:")
     else:
-        yticks = [
-            ts_z[:, nskip:].min(),
-            np.median(ts_z[:, nskip:]),
-            ts_z[:, nskip:].max(),
-        ]
+        sub = ts_z[:, nskip:]
+        yticks = [sub.min(), np.median(sub), sub.max()]
         ax.set_ylim(0, max(yticks[-1] * 1.05, (yticks[-1] - yticks[0]) * 2.0 + yticks[-1]))
         # ax.set_ylim(ts_z[:, nskip:].min() * 0.95,
         #             ts_z[:, nskip:].max() * 1.05)
@@ -474,14 +571,7 @@ def spikesplot(
         ha="left",
         color="gray",
         size=4,
-        bbox={
-            "boxstyle": "round",
-            "fc": "w",
-            "ec": "none",
-            "color": "none",
-            "lw": 0,
-            "alpha": 0.8,
-        },
+        bbox=_ANNOTATION_BBOX,
     )
     ax.set_yticks([])
     ax.set_yticklabels([])
@@ -518,6 +608,8 @@ def spikesplot(
 
 
 def spikesplot_cb(position, cmap="viridis", fig=None):
+    from matplotlib.colorbar import ColorbarBase
+
     # Add colorbar
     if fig is None:
         fig = plt.gcf()
@@ -561,9 +653,9 @@ def confoundplot(
     tseries = np.array(tseries)
 
     # Define nested GridSpec
-    gs = mgs.GridSpecFromSubplotSpec(1, 2, subplot_spec=gs_ts, width_ratios=[1, 100], wspace=0.0)
+    gs = gs_ts.subgridspec(1, 2, width_ratios=[1, 100], wspace=0.0)
 
-    ax_ts = plt.subplot(gs[1])
+    ax_ts = plt.gcf().add_subplot(gs[1])
     ax_ts.grid(False)
 
     # Set 10 frame markers in X axis
@@ -595,14 +687,7 @@ def confoundplot(
             ha="left",
             color=color,
             size=8,
-            bbox={
-                "boxstyle": "round",
-                "fc": "w",
-                "ec": "none",
-                "color": "none",
-                "lw": 0,
-                "alpha": 0.8,
-            },
+            bbox=_ANNOTATION_BBOX,
         )
 
     for side in ["top", "right"]:
@@ -624,11 +709,12 @@ def confoundplot(
     ax_ts.set_yticks([])
     ax_ts.set_yticklabels([])
 
-    nonnan = tseries[~np.isnan(tseries)]
-    if nonnan.size > 0:
-        # Calculate Y limits
-        valrange = nonnan.max() - nonnan.min()
-        def_ylims = [nonnan.min() - 0.1 * valrange, nonnan.max() + 0.1 * valrange]
+    finite = tseries[np.isfinite(tseries)]
+    if finite.size > 0:
+        # Calculate Y limits - reduce the finite values once and reuse
+        minv, maxv = finite.min(), finite.max()
+        valrange = maxv - minv
+        def_ylims = [minv - 0.1 * valrange, maxv + 0.1 * valrange]
         if ylims is not None:
             if ylims[0] is not None:
                 def_ylims[0] = min([def_ylims[0], ylims[0]])
@@ -641,10 +727,9 @@ def confoundplot(
         ax_ts.set_ylim(def_ylims)
 
         # Annotate stats
-        maxv = nonnan.max()
-        mean = nonnan.mean()
-        stdv = nonnan.std()
-        p95 = np.percentile(nonnan, 95.0)
+        mean = finite.mean()
+        stdv = finite.std()
+        p95 = np.percentile(finite, 95.0)
     else:
         maxv = 0
         mean = 0
@@ -665,14 +750,7 @@ def confoundplot(
         ha="right",
         color=color,
         size=4,
-        bbox={
-            "boxstyle": "round",
-            "fc": "w",
-            "ec": "none",
-            "color": "none",
-            "lw": 0,
-            "alpha": 0.8,
-        },
+        bbox=_ANNOTATION_BBOX,
     )
 
     # Annotate percentile 95
@@ -691,9 +769,19 @@ def confoundplot(
     if cutoff is None:
         cutoff = []
 
-    for i, thr in enumerate(cutoff):
-        ax_ts.plot((0, ntsteps - 1), [thr] * 2, linewidth=0.2, color="dimgray")
+    if cutoff:
+        # One collection for all threshold guides instead of a plot per cutoff
+        from matplotlib.collections import LineCollection
 
+        ax_ts.add_collection(
+            LineCollection(
+                [((0, thr), (ntsteps - 1, thr)) for thr in cutoff],
+                colors="dimgray",
+                linewidths=0.2,
+            )
+        )
+
+    for thr in cutoff:
         ax_ts.annotate(
             "%.2f" % thr,
             xy=(0, thr),
@@ -709,7 +797,7 @@ def confoundplot(
     ax_ts.set_xlim((0, ntsteps - 1))
 
     if gs_dist is not None:
-        ax_dist = plt.subplot(gs_dist)
+        ax_dist = plt.gcf().add_subplot(gs_dist)
         sns.displot(tseries, vertical=True, ax=ax_dist)
         ax_dist.set_xlabel("Timesteps")
         ax_dist.set_ylim(ax_ts.get_ylim())
@@ -755,6 +843,8 @@ def compcor_variance_plot(
     output_file: str
         The file where the figure is saved.
     """
+    import pandas as pd
+
     metadata = {}
     if metadata_sources is None:
         if len(metadata_files) == 1:
@@ -765,14 +855,7 @@ def compcor_variance_plot(
         metadata[source] = pd.read_csv(str(file), sep=r"\s+")
         metadata[source]["source"] = source
     metadata = pd.concat(list(metadata.values()))
-    bbox_txt = {
-        "boxstyle": "round",
-        "fc": "white",
-        "ec": "none",
-        "color": "none",
-        "linewidth": 0,
-        "alpha": 0.8,
-    }
+    bbox_txt = _ANNOTATION_BBOX
 
     decompositions = []
     data_sources = list(metadata.groupby(["source", "mask"]).groups.keys())
@@ -897,6 +980,7 @@ def confounds_correlation_plot(
     output_file: :obj:`str`
         The file where the figure is saved.
     """
+    import pandas as pd
     import seaborn as sns
 
     confounds_data = pd.read_table(confounds_file)
@@ -1007,6 +1091,8 @@ def cifti_surfaces_plot(
     output_file: :obj:`str`
         The file where the figure is saved.
     """
+    import nibabel as nb
+    from matplotlib.colors import Normalize
     from nilearn.plotting import plot_surf
 
     def get_surface_meshes(density, surface_type):